@@ -4,8 +4,12 @@
 # Project name: OpenVAS Reporting: A tool to convert OpenVAS XML reports into Excel files.
 # Project URL: https://github.com/TheGroundZero/openvasreporting
 
+import io
 import re
+from copy import deepcopy
 from collections import Counter
+from functools import lru_cache
+from xml.sax.saxutils import escape, quoteattr
 
 from .config import Config
 from .parsed_data import Vulnerability
@@ -18,6 +22,12 @@ import logging
 logging.basicConfig(stream=sys.stderr, level=logging.ERROR,
                     format="%(asctime)s | %(levelname)s | %(name)s | %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 
+# Characters not allowed in Excel sheet names
+_SHEETNAME_TRANS = str.maketrans('', '', "[]\\'\"&@#():*?/")
+
+# Characters that break Word run text into <w:tab/> and <w:br/> elements
+_RE_RUN_SPLIT = re.compile(r"([\t\r\n])")
+
 
 def exporters():
     """
@@ -48,29 +58,29 @@ def _get_collections(vuln_info):
     :rtype vuln_host_by_level: Counter
     :rtype vuln_by_family: Counter
     """
-    vuln_info.sort(key=lambda key: key.name)
-    vuln_info.sort(key=lambda key: key.cvss, reverse=True)
+    vuln_info.sort(key=lambda key: (-key.cvss, key.name))
     vuln_levels = Counter()
     vuln_host_by_level = Counter()
     vuln_by_family = Counter()
-    # collect host names
-    vuln_hostcount_by_level =[[] for _ in range(5)]
-    level_choices = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3, 'none': 4}
-
-    for i, vuln in enumerate(vuln_info, 1):
-        vuln_levels[vuln.level.lower()] += 1
-        # add host names to list so we count unquie hosts per level
-        level_index = level_choices.get(vuln.level.lower())
-
-        for i, (host, port) in enumerate(vuln.hosts, 1):    
-            if host.ip not in vuln_hostcount_by_level[level_index]:
-                vuln_hostcount_by_level[level_index].append(host.ip)       
+    # collect host ips per level so we count unique hosts
+    levels = list(Config.levels().values())
+    hosts_by_level = {level: set() for level in levels}
 
+    for vuln in vuln_info:
+        level = vuln.level
+        vuln_levels[level] += 1
         vuln_by_family[vuln.family] += 1
 
+        try:
+            level_hosts = hosts_by_level[level]
+        except KeyError:
+            continue
+        for host, _ in vuln.hosts:
+            level_hosts.add(host.ip)
+
     # now count hosts per level and return
-    for level in Config.levels().values():
-        vuln_host_by_level[level] = len((vuln_hostcount_by_level[level_choices.get(level.lower())]))
+    for level in levels:
+        vuln_host_by_level[level] = len(hosts_by_level[level])
 
     return vuln_info, vuln_levels, vuln_host_by_level, vuln_by_family
 
@@ -111,11 +121,20 @@ def export_to_excel(vuln_info, template=None, output_file='openvas_report.xlsx')
     # ====================
     # FUNCTIONS
     # ====================
+    @lru_cache(maxsize=4096)
     def __row_height(text, width):
         return (max((len(text) // width), text.count('\n')) + 1) * 15
 
+    def __set_row_height(worksheet, row, text, width):
+        # Short single-line text keeps the default height, no need to emit it
+        if text and (len(text) >= width or '\n' in text):
+            worksheet.set_row(row, __row_height(text, width), None)
+
     workbook = xlsxwriter.Workbook(output_file)
 
+    colors = Config.colors()
+    levels = list(Config.levels().values())
+
     workbook.set_properties({
         'title': output_file,
         'subject': 'OpenVAS report',
@@ -130,13 +149,13 @@ def export_to_excel(vuln_info, template=None, output_file='openvas_report.xlsx')
     workbook.formats[0].set_font_name('Tahoma')
 
     format_sheet_title_content = workbook.add_format({'font_name': 'Tahoma', 'font_size': 12,
-                                                      'font_color': Config.colors()['blue'], 'bold': True,
+                                                      'font_color': colors['blue'], 'bold': True,
                                                       'align': 'center', 'valign': 'vcenter', 'border': 1})
     format_table_titles = workbook.add_format({'font_name': 'Tahoma', 'font_size': 11,
                                                'font_color': 'white', 'bold': True,
                                                'align': 'center', 'valign': 'vcenter',
                                                'border': 1,
-                                               'bg_color': Config.colors()['blue']})
+                                               'bg_color': colors['blue']})
     format_table_cells = workbook.add_format({'font_name': 'Tahoma', 'font_size': 10,
                                               'align': 'left', 'valign': 'top',
                                               'border': 1, 'text_wrap': 1})
@@ -145,31 +164,17 @@ def export_to_excel(vuln_info, template=None, output_file='openvas_report.xlsx')
     format_align_border = workbook.add_format({'font_name': 'Tahoma', 'font_size': 10,
                                                'align': 'center', 'valign': 'top',
                                                'border': 1, 'text_wrap': 1})
-    format_toc = {
-        'critical': workbook.add_format({'font_name': 'Tahoma', 'font_size': 10, 'font_color': 'white',
-                                         'align': 'center', 'valign': 'top',
-                                         'border': 1,
-                                         'bg_color': Config.colors()['critical']}),
-        'high': workbook.add_format({'font_name': 'Tahoma', 'font_size': 10, 'font_color': 'white',
-                                     'align': 'center', 'valign': 'top',
-                                     'border': 1, 'bg_color': Config.colors()['high']}),
-        'medium': workbook.add_format({'font_name': 'Tahoma', 'font_size': 10, 'font_color': 'white',
-                                       'align': 'center', 'valign': 'top',
-                                       'border': 1, 'bg_color': Config.colors()['medium']}),
-        'low': workbook.add_format({'font_name': 'Tahoma', 'font_size': 10, 'font_color': 'white',
-                                    'align': 'center', 'valign': 'top',
-                                    'border': 1, 'bg_color': Config.colors()['low']}),
-        'none': workbook.add_format({'font_name': 'Tahoma', 'font_size': 10, 'font_color': 'white',
-                                     'align': 'center', 'valign': 'top',
-                                     'border': 1, 'bg_color': Config.colors()['none']})
-    }
+    format_toc = {level: workbook.add_format({'font_name': 'Tahoma', 'font_size': 10, 'font_color': 'white',
+                                              'align': 'center', 'valign': 'top',
+                                              'border': 1, 'bg_color': colors[level]})
+                  for level in levels}
 
     # ====================
     # SUMMARY SHEET
     # ====================
     sheet_name = "Summary"
     ws_sum = workbook.add_worksheet(sheet_name)
-    ws_sum.set_tab_color(Config.colors()['blue'])
+    ws_sum.set_tab_color(colors['blue'])
 
     ws_sum.set_column("A:A", 7, format_align_center)
     ws_sum.set_column("B:B", 25, format_align_center)
@@ -180,19 +185,17 @@ def export_to_excel(vuln_info, template=None, output_file='openvas_report.xlsx')
     # --------------------
     # VULN SUMMARY
     # --------------------
-    ws_sum.merge_range("B2:D2", "VULNERABILITY SUMMARY", format_sheet_title_content)
-    ws_sum.write("B3", "Threat", format_table_titles)
-    ws_sum.write("C3", "Vulns number", format_table_titles)
-    ws_sum.write("D3", "Affected hosts", format_table_titles)
+    ws_sum.merge_range(1, 1, 1, 3, "VULNERABILITY SUMMARY", format_sheet_title_content)
+    ws_sum.write_row(2, 1, ["Threat", "Vulns number", "Affected hosts"], format_table_titles)
 
-    for i, level in enumerate(Config.levels().values(), 4):
-        ws_sum.write("B{}".format(i), level.capitalize(), format_sheet_title_content)
-        ws_sum.write("C{}".format(i), vuln_levels[level], format_align_border)
-        ws_sum.write("D{}".format(i), vuln_host_by_level[level], format_align_border)
+    for i, level in enumerate(levels, 3):
+        ws_sum.write(i, 1, level.capitalize(), format_sheet_title_content)
+        ws_sum.write(i, 2, vuln_levels[level], format_align_border)
+        ws_sum.write(i, 3, vuln_host_by_level[level], format_align_border)
 
-    ws_sum.write("B9", "Total", format_table_titles)
-    ws_sum.write_formula("C9", "=SUM($C$4:$C$8)", format_table_titles)
-    ws_sum.write_formula("D9", "=SUM($D$4:$D$8)", format_table_titles)
+    ws_sum.write(8, 1, "Total", format_table_titles)
+    ws_sum.write_number(8, 2, sum(vuln_levels.values()), format_table_titles)
+    ws_sum.write_number(8, 3, sum(vuln_host_by_level.values()), format_table_titles)
 
     # --------------------
     # CHART
@@ -200,37 +203,29 @@ def export_to_excel(vuln_info, template=None, output_file='openvas_report.xlsx')
     chart_vulns_summary = workbook.add_chart({'type': 'pie'})
     chart_vulns_summary.add_series({
         'name': 'vulnerability summary by affected hosts',
-        'categories': '={}!B4:B8'.format(sheet_name),
-        'values': '={}!D4:D8'.format(sheet_name),
+        'categories': [sheet_name, 3, 1, 7, 1],
+        'values': [sheet_name, 3, 3, 7, 3],
         'data_labels': {'value': True, 'position': 'outside_end', 'leader_lines': True, 'font': {'name': 'Tahoma'}},
-        'points': [
-            {'fill': {'color': Config.colors()['critical']}},
-            {'fill': {'color': Config.colors()['high']}},
-            {'fill': {'color': Config.colors()['medium']}},
-            {'fill': {'color': Config.colors()['low']}},
-            {'fill': {'color': Config.colors()['none']}},
-        ],
+        'points': [{'fill': {'color': colors[level]}} for level in levels],
     })
     chart_vulns_summary.set_title({'name': 'Vulnerability summary', 'overlay': False, 'name_font': {'name': 'Tahoma'}})
     chart_vulns_summary.set_size({'width': 500, 'height': 300})
     chart_vulns_summary.set_legend({'position': 'right', 'font': {'name': 'Tahoma'}})
-    ws_sum.insert_chart("F2", chart_vulns_summary)
+    ws_sum.insert_chart(1, 5, chart_vulns_summary)
 
     # --------------------
     # VULN BY FAMILY
     # --------------------
-    ws_sum.merge_range("B19:C19", "VULNERABILITIES BY FAMILY", format_sheet_title_content)
-    ws_sum.write("B20", "family", format_table_titles)
-    ws_sum.write("C20", "vulns number", format_table_titles)
+    ws_sum.merge_range(18, 1, 18, 2, "VULNERABILITIES BY FAMILY", format_sheet_title_content)
+    ws_sum.write_row(19, 1, ["family", "vulns number"], format_table_titles)
 
-    last = 21
-    for i, (family, number) in enumerate(iter(vuln_by_family.items()), last):
-        ws_sum.write("B{}".format(i), family, format_align_border)
-        ws_sum.write("C{}".format(i), number, format_align_border)
-        last = i
+    last = 20
+    for last, (family, number) in enumerate(vuln_by_family.items(), last):
+        ws_sum.write(last, 1, family, format_align_border)
+        ws_sum.write(last, 2, number, format_align_border)
 
-    ws_sum.write("B{}".format(str(last + 1)), "Total", format_table_titles)
-    ws_sum.write_formula("C{}".format(str(last + 1)), "=SUM($C$21:$C${})".format(last), format_table_titles)
+    ws_sum.write(last + 1, 1, "Total", format_table_titles)
+    ws_sum.write_number(last + 1, 2, sum(vuln_by_family.values()), format_table_titles)
 
     # --------------------
     # CHART
@@ -238,22 +233,22 @@ def export_to_excel(vuln_info, template=None, output_file='openvas_report.xlsx')
     chart_vulns_by_family = workbook.add_chart({'type': 'pie'})
     chart_vulns_by_family.add_series({
         'name': 'vulnerability summary by family',
-        'categories': '={}!B21:B{}'.format(sheet_name, last),
-        'values': '={}!C21:C{}'.format(sheet_name, last),
+        'categories': [sheet_name, 20, 1, last, 1],
+        'values': [sheet_name, 20, 2, last, 2],
         'data_labels': {'value': True, 'position': 'best_fit', 'leader_lines': True, 'font': {'name': 'Tahoma'}},
     })
     chart_vulns_by_family.set_title({'name': 'Vulnerability by family', 'overlay': False,
                                      'name_font': {'name': 'Tahoma'}})
     chart_vulns_by_family.set_size({'width': 500, 'height': 500})
     chart_vulns_by_family.set_legend({'position': 'bottom', 'font': {'name': 'Tahoma'}})
-    ws_sum.insert_chart("F19", chart_vulns_by_family)
+    ws_sum.insert_chart(18, 5, chart_vulns_by_family)
 
     # ====================
     # TABLE OF CONTENTS
     # ====================
     sheet_name = "TOC"
     ws_toc = workbook.add_worksheet(sheet_name)
-    ws_toc.set_tab_color(Config.colors()['blue'])
+    ws_toc.set_tab_color(colors['blue'])
 
     ws_toc.set_column("A:A", 7)
     ws_toc.set_column("B:B", 5)
@@ -262,117 +257,182 @@ def export_to_excel(vuln_info, template=None, output_file='openvas_report.xlsx')
     ws_toc.set_column("E:E", 50)
     ws_toc.set_column("F:F", 7)
 
-    ws_toc.merge_range("B2:E2", "TABLE OF CONTENTS", format_sheet_title_content)
-    ws_toc.write("B3", "No.", format_table_titles)
-    ws_toc.write("C3", "Vuln Title", format_table_titles)
-    ws_toc.write("D3", "Level", format_table_titles)
-    ws_toc.write("E3", "Hosts", format_table_titles)
+    ws_toc.merge_range(1, 1, 1, 4, "TABLE OF CONTENTS", format_sheet_title_content)
+    ws_toc.write_row(2, 1, ["No.", "Vuln Title", "Level", "Hosts"], format_table_titles)
 
     # ====================
     # VULN SHEETS
     # ====================
+    vuln_columns = [(0, 7), (1, 20), (2, 20), (3, 50), (4, 15), (5, 15), (6, 20), (7, 7)]
+    vuln_titles = ["Title", "Description", "Impact", "Recommendation", "Details", "CVEs", "CVSS", "Level", "Family",
+                   "References"]
+    content_width = 120
+
     for i, vuln in enumerate(vuln_info, 1):
-        name = re.sub(r"[\[\]\\\'\"&@#():*?/]", "", vuln.name)
+        level = vuln.level
+        level_name = level.capitalize()
+        name = vuln.name.translate(_SHEETNAME_TRANS)
         if len(name) > 27:
-            name = "{}..{}".format(name[0:15], name[-10:])
-        name = "{:03X}_{}".format(i, name)
+            name = f"{name[0:15]}..{name[-10:]}"
+        name = f"{i:03X}_{name}"
         ws_vuln = workbook.add_worksheet(name)
-        ws_vuln.set_tab_color(Config.colors()[vuln.level.lower()])
+        ws_vuln.set_tab_color(colors[level])
+        write = ws_vuln.write
+        merge = ws_vuln.merge_range
 
         # --------------------
         # TABLE OF CONTENTS
         # --------------------
-        ws_toc.write("B{}".format(i + 3), "{:03X}".format(i), format_table_cells)
-        ws_toc.write_url("C{}".format(i + 3), "internal:'{}'!A1".format(name), format_table_cells, string=vuln.name)
-        ws_toc.write("D{}".format(i + 3), "{:.1f} ({})".format(vuln.cvss, vuln.level.capitalize()),
-                     format_toc[vuln.level])
-        ws_toc.write("E{}".format(i + 3), "{}".format(', '.join([host.ip for host, _ in vuln.hosts])),
-                     format_table_cells)
-        ws_vuln.write_url("A1", "internal:'{}'!A{}".format(ws_toc.get_name(), i + 3), format_align_center,
+        hosts = vuln.hosts
+        ip_csv = ', '.join(host.ip for host, _ in hosts)
+        ws_toc.write(i + 2, 1, f"{i:03X}", format_table_cells)
+        ws_toc.write_url(i + 2, 2, f"internal:'{name}'!A1", format_table_cells, string=vuln.name)
+        ws_toc.write(i + 2, 3, f"{vuln.cvss:.1f} ({level_name})", format_toc[level])
+        ws_toc.write(i + 2, 4, ip_csv, format_table_cells)
+        ws_vuln.write_url(0, 0, f"internal:'{ws_toc.get_name()}'!A{i + 3}", format_align_center,
                           string="<< TOC")
-        ws_toc.set_row(i + 3, __row_height(name, 150), None)
+        __set_row_height(ws_toc, i + 2, name, 150)
 
         # --------------------
         # VULN INFO
         # --------------------
-        ws_vuln.set_column("A:A", 7, format_align_center)
-        ws_vuln.set_column("B:B", 20, format_align_center)
-        ws_vuln.set_column("C:C", 20, format_align_center)
-        ws_vuln.set_column("D:D", 50, format_align_center)
-        ws_vuln.set_column("E:E", 15, format_align_center)
-        ws_vuln.set_column("F:F", 15, format_align_center)
-        ws_vuln.set_column("G:G", 20, format_align_center)
-        ws_vuln.set_column("H:H", 7, format_align_center)
-        content_width = 120
-
-        ws_vuln.write('B2', "Title", format_table_titles)
-        ws_vuln.merge_range("C2:G2", vuln.name, format_sheet_title_content)
-        ws_vuln.set_row(1, __row_height(vuln.name, content_width), None)
-
-        ws_vuln.write('B3', "Description", format_table_titles)
-        ws_vuln.merge_range("C3:G3", vuln.description, format_table_cells)
-        ws_vuln.set_row(2, __row_height(vuln.description, content_width), None)
-
-        ws_vuln.write('B4', "Impact", format_table_titles)
-        ws_vuln.merge_range("C4:G4", vuln.impact, format_table_cells)
-        ws_vuln.set_row(3, __row_height(vuln.impact, content_width), None)
-
-        ws_vuln.write('B5', "Recommendation", format_table_titles)
-        ws_vuln.merge_range("C5:G5", vuln.solution, format_table_cells)
-        ws_vuln.set_row(4, __row_height(vuln.solution, content_width), None)
-
-        ws_vuln.write('B6', "Details", format_table_titles)
-        ws_vuln.merge_range("C6:G6", vuln.insight, format_table_cells)
-        ws_vuln.set_row(5, __row_height(vuln.insight, content_width), None)
-
-        ws_vuln.write('B7', "CVEs", format_table_titles)
+        for col, col_width in vuln_columns:
+            ws_vuln.set_column(col, col, col_width, format_align_center)
+
+        ws_vuln.write_column(1, 1, vuln_titles, format_table_titles)
+
+        __set_row_height(ws_vuln, 1, vuln.name, content_width)
+        merge(1, 2, 1, 6, vuln.name, format_sheet_title_content)
+
+        __set_row_height(ws_vuln, 2, vuln.description, content_width)
+        merge(2, 2, 2, 6, vuln.description, format_table_cells)
+
+        __set_row_height(ws_vuln, 3, vuln.impact, content_width)
+        merge(3, 2, 3, 6, vuln.impact, format_table_cells)
+
+        __set_row_height(ws_vuln, 4, vuln.solution, content_width)
+        merge(4, 2, 4, 6, vuln.solution, format_table_cells)
+
+        __set_row_height(ws_vuln, 5, vuln.insight, content_width)
+        merge(5, 2, 5, 6, vuln.insight, format_table_cells)
+
         cves = ", ".join(vuln.cves)
         cves = cves.upper() if cves != "" else "No CVE"
-        ws_vuln.merge_range("C7:G7", cves, format_table_cells)
-        ws_vuln.set_row(6, __row_height(cves, content_width), None)
+        __set_row_height(ws_vuln, 6, cves, content_width)
+        merge(6, 2, 6, 6, cves, format_table_cells)
 
-        ws_vuln.write('B8', "CVSS", format_table_titles)
         cvss = float(vuln.cvss)
         if cvss >= 0.0:
-            ws_vuln.merge_range("C8:G8", "{:.1f}".format(cvss), format_table_cells)
+            merge(7, 2, 7, 6, f"{cvss:.1f}", format_table_cells)
         else:
-            ws_vuln.merge_range("C8:G8", "{}".format("No CVSS"), format_table_cells)
+            merge(7, 2, 7, 6, "No CVSS", format_table_cells)
 
-        ws_vuln.write('B9', "Level", format_table_titles)
-        ws_vuln.merge_range("C9:G9", vuln.level.capitalize(), format_table_cells)
+        merge(8, 2, 8, 6, level_name, format_table_cells)
 
-        ws_vuln.write('B10', "Family", format_table_titles)
-        ws_vuln.merge_range("C10:G10", vuln.family, format_table_cells)
+        merge(9, 2, 9, 6, vuln.family, format_table_cells)
 
-        ws_vuln.write('B11', "References", format_table_titles)
-        ws_vuln.merge_range("C11:G11", vuln.references, format_table_cells)
-        ws_vuln.set_row(10, __row_height(vuln.references, content_width), None)
+        __set_row_height(ws_vuln, 10, vuln.references, content_width)
+        merge(10, 2, 10, 6, vuln.references, format_table_cells)
 
-        ws_vuln.write('C13', "IP", format_table_titles)
-        ws_vuln.write('D13', "Host name", format_table_titles)
-        ws_vuln.write('E13', "Port number", format_table_titles)
-        ws_vuln.write('F13', "Port protocol", format_table_titles)
-        ws_vuln.write('G13', "Port Result", format_table_titles)
+        ws_vuln.write_row(12, 2, ["IP", "Host name", "Port number", "Port protocol", "Port Result"],
+                          format_table_titles)
 
         # --------------------
         # AFFECTED HOSTS
         # --------------------
-        for j, (host, port) in enumerate(vuln.hosts, 14):
+        for j, (host, port) in enumerate(hosts, 13):
 
-            ws_vuln.write("C{}".format(j), host.ip)
-            ws_vuln.write("D{}".format(j), host.host_name if host.host_name else "-")
+            write(j, 2, host.ip)
+            write(j, 3, host.host_name if host.host_name else "-")
 
             if port:
-                ws_vuln.write("E{}".format(j), "" if port.number == 0 else port.number)
-                ws_vuln.write("F{}".format(j), port.protocol)
-                ws_vuln.write("G{}".format(j), port.result, format_table_cells)
-                ws_vuln.set_row(j, __row_height(port.result, content_width), None)
+                write(j, 4, "" if port.number == 0 else port.number)
+                write(j, 5, port.protocol)
+                write(j, 6, port.result, format_table_cells)
+                __set_row_height(ws_vuln, j, port.result, content_width)
             else:
-                ws_vuln.write("E{}".format(j), "No port info")
+                write(j, 4, "No port info")
 
     workbook.close()
 
 
+def _apply_style(cells, ppr):
+    """
+    Center table cells vertically and apply a paragraph style to their content, in a single pass.
+    The style is set by inserting a copy of a prebuilt <w:pPr>, bypassing python-docx's style setter.
+
+    :param cells: new table cells, holding a single paragraph without properties
+    :type cells: list(docx.table._Cell)
+
+    :param ppr: paragraph properties referencing the style
+    :type ppr: docx.oxml.text.parfmt.CT_PPr
+    """
+    from docx.oxml.shared import qn
+    from docx.enum.table import WD_ALIGN_VERTICAL
+
+    for cell in cells:
+        cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+        cell._tc.find(qn('w:p')).insert(0, deepcopy(ppr))
+
+
+def _docx_run_xml(text):
+    """
+    Build the OOXML of a run holding text, laid out as python-docx's Run.text setter does:
+    tabs become <w:tab/>, newlines and carriage returns become <w:br/>.
+
+    :param text: run text
+    :type text: str
+
+    :return: <w:r> element as string
+    :rtype: str
+    """
+    content = []
+    for piece in _RE_RUN_SPLIT.split(text):
+        if piece == "\t":
+            content.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            content.append("<w:br/>")
+        elif piece:
+            preserve = ' xml:space="preserve"' if len(piece.strip()) < len(piece) else ''
+            content.append("<w:t{}>{}</w:t>".format(preserve, escape(piece)))
+    return "<w:r>{}</w:r>".format("".join(content))
+
+
+def _docx_table(rows, col_widths, cell_width, fixed=False):
+    """
+    Build a whole table element in a single parse, instead of creating it with document.add_table
+    and mutating it cell by cell through python-docx.
+
+    :param rows: table rows, each row being a list of cells as (tcPr extra OOXML, content OOXML) tuples
+    :type rows: list(list(tuple(str, str)))
+
+    :param col_widths: grid column widths, in twips
+    :type col_widths: list(int)
+
+    :param cell_width: width of each cell (w:tcW), in twips
+    :type cell_width: int
+
+    :param fixed: use a fixed table layout (no autofit)
+    :type fixed: bool
+
+    :return: <w:tbl> element
+    :rtype: CT_Tbl
+    """
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import nsdecls
+
+    cell_fmt = '<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{}"/>{{}}</w:tcPr>{{}}</w:tc>'.format(cell_width)
+    return parse_xml(
+        '<w:tbl {}><w:tblPr><w:tblW w:type="auto" w:w="0"/>{}'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" w:noHBand="0"'
+        ' w:noVBand="1" w:val="04A0"/></w:tblPr><w:tblGrid>{}</w:tblGrid>{}</w:tbl>'.format(
+            nsdecls('w'),
+            '<w:tblLayout w:type="fixed"/>' if fixed else '',
+            "".join('<w:gridCol w:w="{}"/>'.format(width) for width in col_widths),
+            "".join("<w:tr>{}</w:tr>".format("".join(cell_fmt.format(tc_pr, content) for tc_pr, content in row))
+                    for row in rows)))
+
+
 def export_to_word(vuln_info, template, output_file='openvas_report.docx'):
     """
     Export vulnerabilities info in a Word file.
@@ -386,20 +446,20 @@ def export_to_word(vuln_info, template, output_file='openvas_report.docx'):
     :param template: Path to Docx template
     :type template: str
 
-    :raises: TypeError
+    :raises: TypeError, ImportError
     """
 
+    import matplotlib
+    # Headless rendering only, skip GUI backend probing
+    matplotlib.use('Agg')
     import matplotlib.pyplot as plt
     import numpy as np
-    import tempfile
-    import os
-    import math
 
     from docx import Document
     from docx.oxml.shared import qn, OxmlElement
     from docx.oxml.ns import nsdecls
     from docx.oxml import parse_xml
-    from docx.shared import Cm, Pt, Twips
+    from docx.shared import Cm, Emu, Pt, Twips
     from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
     from docx.enum.section import WD_ORIENT
     from docx.enum.style import WD_STYLE_TYPE
@@ -617,10 +677,15 @@ def export_to_word(vuln_info, template, output_file='openvas_report.docx'):
     # --------------------
     document.add_paragraph('Summary', style='OR-Heading_2')
 
-    colors_sum = []
-    labels_sum = []
-    vuln_sum = []
-    aff_sum = []
+    levels = list(Config.levels().values())
+    colors = Config.colors()
+
+    # Cell styles are shared by the summary table and the vuln tables
+    cell_style = doc_styles['OR-cell']
+    cell_bold_style = doc_styles['OR-cell_bold']
+    ppr_xml = '<w:pPr {}><w:pStyle w:val={{}}/></w:pPr>'.format(nsdecls('w'))
+    cell_ppr = parse_xml(ppr_xml.format(quoteattr(cell_style.style_id)))
+    cell_bold_ppr = parse_xml(ppr_xml.format(quoteattr(cell_bold_style.style_id)))
 
     table_summary = document.add_table(rows=1, cols=3)
     
@@ -632,41 +697,37 @@ def export_to_word(vuln_info, template, output_file='openvas_report.docx'):
     hdr_cells[2].paragraphs[0].add_run('Affected hosts')
     # FIELDS
     # --------------------
-    # Provide data to table and charts
-    for level in Config.levels().values():
+    for level in levels:
         row_cells = table_summary.add_row().cells
-        row_cells[0].text = level.capitalize()
-        row_cells[1].text = str(vuln_levels[level])
-        row_cells[2].text = str(vuln_host_by_level[level])
-        colors_sum.append(Config.colors()[level])
-        labels_sum.append(level)
-        vuln_sum.append(vuln_levels[level])
-        aff_sum.append(vuln_host_by_level[level])
-    
+        # New cells hold an empty paragraph, add runs to it instead of rebuilding it through cell.text
+        row_cells[0].paragraphs[0].add_run(level.capitalize())
+        row_cells[1].paragraphs[0].add_run(str(vuln_levels[level]))
+        row_cells[2].paragraphs[0].add_run(str(vuln_host_by_level[level]))
+
+    # Provide data to charts
+    colors_sum = [colors[level] for level in levels]
+    labels_sum = levels
+    vuln_sum = np.fromiter((vuln_levels[level] for level in levels), dtype=np.int64, count=len(levels))
+    aff_sum = np.fromiter((vuln_host_by_level[level] for level in levels), dtype=np.int64, count=len(levels))
+
     # Apply styles
     # --------------------
-    for h in hdr_cells:
-        h.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-        for p in h.paragraphs:
-            p.style = doc_styles['OR-cell_bold']
-    
+    _apply_style(hdr_cells, cell_bold_ppr)
     for r in table_summary.rows[1:]:
-        for c in r.cells:
-            c.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            for p in c.paragraphs:
-                p.style = doc_styles['OR-cell']
+        _apply_style(r.cells, cell_ppr)
 
     # --------------------
     # CHART
     # --------------------
-    fd, path = tempfile.mkstemp(suffix='.png')
     chart_dpi    = 144
     chart_height = Cm(8);
     par_chart = document.add_paragraph(style='OR-base')
     par_chart.alignment = WD_ALIGN_PARAGRAPH.CENTER
     run_chart = par_chart.add_run()
 
-    bar_chart, bar_axis = plt.subplots(dpi=chart_dpi)
+    # Both charts are drawn in turn on the same figure
+    chart = plt.figure(dpi=chart_dpi)
+    bar_axis = chart.add_subplot(1, 1, 1)
     bar_axis.set_title('Vulnerability summary by risk level', fontsize=10)
 
     pos = np.arange(len(labels_sum))
@@ -674,55 +735,85 @@ def export_to_word(vuln_info, template, output_file='openvas_report.docx'):
 
     bar_axis.set_xticks(pos)
     bar_axis.set_xticklabels(labels_sum)
-    bar_chart.gca().spines['left'].set_visible(False)
-    bar_chart.gca().spines['right'].set_visible(False)
-    bar_chart.gca().spines['top'].set_visible(False)
-    bar_chart.gca().spines['bottom'].set_position('zero')
+    bar_axis.spines['left'].set_visible(False)
+    bar_axis.spines['right'].set_visible(False)
+    bar_axis.spines['top'].set_visible(False)
+    bar_axis.spines['bottom'].set_position('zero')
     bar_axis.tick_params(top=False, bottom=True, left=False, right=False,
                     labelleft=False, labelbottom=True)
-    bars_vuln = plt.bar(pos - width / 2, vuln_sum, width, align='center', label='Vulnerabilities',
-                        color=colors_sum, edgecolor='black')
-    bars_aff = plt.bar(pos + width / 2, aff_sum, width, align='center', label='Affected hosts',
-                       color=colors_sum, edgecolor='black', hatch='//')
-    for barcontainer in (bars_vuln, bars_aff):
-        for bar in barcontainer:
-            height = bar.get_height()
-            bar_chart.gca().text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 0.3, str(int(height)),
-                           ha='center', color='black', fontsize=8)
-    bar_chart.legend()
-
-    bar_chart.savefig(path)
+    bar_axis.bar(pos - width / 2, vuln_sum, width, align='center', label='Vulnerabilities',
+                 color=colors_sum, edgecolor='black')
+    bar_axis.bar(pos + width / 2, aff_sum, width, align='center', label='Affected hosts',
+                 color=colors_sum, edgecolor='black', hatch='//')
+    for centers, heights in ((pos - width / 2, vuln_sum), (pos + width / 2, aff_sum)):
+        for x, height in zip(centers, heights):
+            bar_axis.text(x, height + 0.3, str(height), ha='center', color='black', fontsize=8)
+    chart.legend()
+
+    bar_buf = io.BytesIO()
+    chart.savefig(bar_buf, format='png')
+    bar_buf.seek(0)
 
     # plt.show()  # DEBUG
     
     bar_height = chart_height
-    run_chart.add_picture(path, height=bar_height)
-    os.remove(path)
+    run_chart.add_picture(bar_buf, height=bar_height)
 
-    pie_chart, pie_axis = plt.subplots(dpi=chart_dpi, subplot_kw=dict(aspect="equal"))
+    chart.clear()
+    pie_axis = chart.add_subplot(1, 1, 1, aspect="equal")
     pie_axis.set_title('Vulnerability by family', fontsize=10)
     
     values = list(vuln_by_family.values())
     pie, tx, autotexts = pie_axis.pie(values, labels=vuln_by_family.keys(), autopct='', textprops=dict(fontsize=8))
     for i, txt in enumerate(autotexts):
         txt.set_text('{}'.format(values[i]))
-    pie_chart.savefig(path)
+    pie_buf = io.BytesIO()
+    chart.savefig(pie_buf, format='png')
+    plt.close(chart)
+    pie_buf.seek(0)
 
     # plt.show()  # DEBUG
     pie_height = chart_height
-    run_chart.add_picture(path, height=pie_height)
-    os.remove(path)
+    run_chart.add_picture(pie_buf, height=pie_height)
 
     # ====================
     # VULN PAGES
     # ====================
+    # Vuln and hosts tables are built as raw OOXML and parsed once each: going through python-docx's
+    # table API reconciles the XML on every cell access, which dominates on large reports
+    body = document.element.body
+    cell_par = '<w:p><w:pPr><w:pStyle w:val={}/></w:pPr>{{}}</w:p>'.format(quoteattr(cell_style.style_id))
+    cell_bold_par = '<w:p><w:pPr><w:pStyle w:val={}/></w:pPr>{{}}</w:p>'.format(quoteattr(cell_bold_style.style_id))
+
+    vuln_col_widths = [Cm(0.35).twips, Cm(2.85).twips]
+    vuln_col_widths.append(Emu(page_width).twips - sum(vuln_col_widths))
+    vuln_cell_width = Emu(page_width // len(vuln_col_widths)).twips
+    vuln_headers = [cell_bold_par.format(_docx_run_xml(header))
+                    for header in ('Description', 'Impact', 'Recommendation', 'Details',
+                                   'CVSS', 'CVEs', 'Family', 'References')]
+
+    host_col_widths = [Cm(2.8).twips, Cm(3.0).twips, Cm(2.0).twips, Cm(2.0).twips]
+    host_col_widths.append(Emu(page_width).twips - sum(host_col_widths))
+    host_cell_width = Emu(page_width // len(host_col_widths)).twips
+    host_headers = [('', cell_bold_par.format(_docx_run_xml(header)))
+                    for header in ('IP', 'Host name', 'Port number', 'Port protocol', 'Port result')]
+    host_empty = ('', cell_par.format(''))
+
+    # Per vuln paragraphs are inserted as raw OOXML too, styles are resolved once here instead of by name
+    # for every paragraph
+    styled_par = '<w:p {}><w:pPr><w:pStyle w:val={{}}/></w:pPr>{{{{}}}}</w:p>'.format(nsdecls('w'))
+    title_pars = {level: styled_par.format(quoteattr(doc_styles['OR-Vuln_title_' + level].style_id))
+                  for level in levels}
+    hosts_par = parse_xml(styled_par.format(quoteattr(doc_styles['OR-Vuln_hosts'].style_id)).format(
+        _docx_run_xml('Vulnerable hosts')))
+
     cur_level = ""
 
     for i, vuln in enumerate(vuln_info, 1):
         # --------------------
         # GENERAL
         # --------------------
-        level = vuln.level.lower()
+        level = vuln.level
 
         if level != cur_level:
             document.add_paragraph(
@@ -732,34 +823,7 @@ def export_to_word(vuln_info, template, output_file='openvas_report.docx'):
             document.add_page_break()
 
         title = "[{}] {}".format(level.upper(), vuln.name)
-        par = document.add_paragraph(title, style='OR-Vuln_title_'+vuln.level)
-        
-        table_vuln = document.add_table(rows=8, cols=3)
-        table_vuln.autofit = False
-        table_vuln.columns[0].width = Cm(0.35)
-        table_vuln.columns[1].width = Cm(2.85)
-        table_vuln.columns[-1].width = page_width
-        for c in range (len(table_vuln.columns)-1):
-            table_vuln.columns[-1].width -= table_vuln.columns[c].width
-
-        # COLOR
-        # --------------------
-        col_cells = table_vuln.columns[0].cells
-        col_cells[0].merge(col_cells[7])
-        color_fill = parse_xml(r'<w:shd {} w:fill="{}"/>'.format(nsdecls('w'), Config.colors()[vuln.level][1:]))
-        col_cells[0]._tc.get_or_add_tcPr().append(color_fill)
-
-        # TABLE HEADERS
-        # --------------------
-        hdr_cells = table_vuln.columns[1].cells
-        hdr_cells[0].paragraphs[0].add_run('Description')
-        hdr_cells[1].paragraphs[0].add_run('Impact')
-        hdr_cells[2].paragraphs[0].add_run('Recommendation')
-        hdr_cells[3].paragraphs[0].add_run('Details')
-        hdr_cells[4].paragraphs[0].add_run('CVSS')
-        hdr_cells[5].paragraphs[0].add_run('CVEs')
-        hdr_cells[6].paragraphs[0].add_run('Family')
-        hdr_cells[7].paragraphs[0].add_run('References')
+        body._insert_p(parse_xml(title_pars[level].format(_docx_run_xml(title))))
 
         # FIELDS
         # --------------------
@@ -768,74 +832,32 @@ def export_to_word(vuln_info, template, output_file='openvas_report.docx'):
 
         cvss = str(vuln.cvss) if vuln.cvss != -1.0 else "No CVSS"
 
-        txt_cells = table_vuln.columns[2].cells
-        txt_cells[0].text = vuln.description
-        txt_cells[1].text = vuln.impact
-        txt_cells[2].text = vuln.solution
-        txt_cells[3].text = vuln.insight
-        txt_cells[4].text = cvss
-        txt_cells[5].text = cves
-        txt_cells[6].text = vuln.family
-        txt_cells[7].text = vuln.references
-        for c in txt_cells:
-            for p in c.paragraphs:
-                p.style = doc_styles['OR-cell']
-        
-        # Apply styles
-        # --------------------
-        for h in hdr_cells:
-            for p in h.paragraphs:
-                p.style = doc_styles['OR-cell_bold']
-        
-        for c in txt_cells:
-            for p in c.paragraphs:
-                p.style = doc_styles['OR-cell']
+        fields = (vuln.description, vuln.impact, vuln.solution, vuln.insight,
+                  cvss, cves, vuln.family, vuln.references)
+
+        # First column is a single merged cell filled with the level color
+        color_cells = ['<w:vMerge/>'] * len(fields)
+        color_cells[0] = '<w:vMerge w:val="restart"/><w:shd w:fill="{}"/>'.format(colors[level][1:])
+
+        rows = [[(color, '<w:p/>'), ('', header), ('', cell_par.format(_docx_run_xml(field)))]
+                for color, header, field in zip(color_cells, vuln_headers, fields)]
+        body._insert_tbl(_docx_table(rows, vuln_col_widths, vuln_cell_width, fixed=True))
 
         # VULN HOSTS
         # --------------------
-        document.add_paragraph('Vulnerable hosts', style='OR-Vuln_hosts')
-
-        # add coloumn for result per port and resize columns
-        table_hosts = document.add_table(cols=5, rows=(len(vuln.hosts) + 1))
-
-        table_hosts.columns[0].width  = Cm(2.8)
-        table_hosts.columns[1].width  = Cm(3.0)
-        table_hosts.columns[2].width  = Cm(2.0)
-        table_hosts.columns[3].width  = Cm(2.0)
-        table_hosts.columns[-1].width = page_width
-        for c in range (len(table_hosts.columns)-1):
-            table_hosts.columns[-1].width -= table_hosts.columns[c].width
-        
-        # TABLE HEADERS
-        # --------------------
-        hdr_cells = table_hosts.rows[0].cells
-        hdr_cells[0].paragraphs[0].add_run('IP')
-        hdr_cells[1].paragraphs[0].add_run('Host name')
-        hdr_cells[2].paragraphs[0].add_run('Port number')
-        hdr_cells[3].paragraphs[0].add_run('Port protocol')
-        hdr_cells[4].paragraphs[0].add_run('Port result')
-        # FIELDS
-        # --------------------
-        for j, (host, port) in enumerate(vuln.hosts, 1):
-            cells = table_hosts.rows[j].cells
-            cells[0].text = host.ip
-            cells[1].text = host.host_name if host.host_name else "-"
+        body._insert_p(deepcopy(hosts_par))
+
+        rows = [host_headers]
+        for host, port in vuln.hosts:
+            cells = [host.ip, host.host_name if host.host_name else "-"]
             if port and port is not None:
-                cells[2].text = "-" if port.number == 0 else str(port.number)
-                cells[3].text = port.protocol
-                cells[4].text = port.result
+                cells.extend(("-" if port.number == 0 else str(port.number), port.protocol, port.result))
             else:
-                cells[2].text = "No port info"
-        
-        # Apply styles
-        # --------------------
-        for h in hdr_cells:
-            for p in h.paragraphs:
-                p.style = doc_styles['OR-cell_bold']
-        for r in table_hosts.rows[1:]:
-            for c in r.cells:
-                for p in c.paragraphs:
-                    p.style = doc_styles['OR-cell']
+                cells.append("No port info")
+            row = [('', cell_par.format(_docx_run_xml(cell))) for cell in cells]
+            row.extend([host_empty] * (len(host_col_widths) - len(row)))
+            rows.append(row)
+        body._insert_tbl(_docx_table(rows, host_col_widths, host_cell_width))
 
     document.save(output_file)
 
@@ -875,7 +897,7 @@ def export_to_csv(vuln_info, template=None, output_file='openvas_report.csv'):
 
     vuln_info, _, _, _ = _get_collections(vuln_info)
 
-    with open(output_file, 'w') as csvfile:
+    with open(output_file, 'w', buffering=1 << 20, newline='') as csvfile:
         fieldnames = ['hostname', 'ip', 'port', 'protocol',
                       'vulnerability', 'cvss', 'threat', 'family',
                       'description', 'detection', 'insight', 'impact', 'affected', 'solution', 'solution_type',
@@ -883,26 +905,28 @@ def export_to_csv(vuln_info, template=None, output_file='openvas_report.csv'):
         writer = csv.DictWriter(csvfile, dialect='excel', fieldnames=fieldnames)
         writer.writeheader()
 
+        rows = []
         for vuln in vuln_info:
+            # Fields shared by every host affected by this vuln
+            vuln_data = {
+                'vulnerability': vuln.name,
+                'cvss': vuln.cvss,
+                'threat': vuln.level,
+                'family': vuln.family,
+                'description': vuln.description,
+                'detection': vuln.detect,
+                'insight': vuln.insight,
+                'impact': vuln.impact,
+                'affected': vuln.affected,
+                'solution': vuln.solution,
+                'solution_type': vuln.solution_type,
+                'vuln_id': vuln.vuln_id,
+                'cve': ' - '.join(vuln.cves),
+                'references': ' - '.join(vuln.references)
+            }
             for (host, port) in vuln.hosts:
-                rowdata = {
-                    'hostname': host.host_name,
-                    'ip': host.ip,
-                    'port': port.number,
-                    'protocol': port.protocol,
-                    'vulnerability': vuln.name,
-                    'cvss': vuln.cvss,
-                    'threat': vuln.level,
-                    'family': vuln.family,
-                    'description': vuln.description,
-                    'detection': vuln.detect,
-                    'insight': vuln.insight,
-                    'impact': vuln.impact,
-                    'affected': vuln.affected,
-                    'solution': vuln.solution,
-                    'solution_type': vuln.solution_type,
-                    'vuln_id': vuln.vuln_id,
-                    'cve': ' - '.join(vuln.cves),
-                    'references': ' - '.join(vuln.references)
-                }
-                writer.writerow(rowdata)
+                rowdata = dict(vuln_data, hostname=host.host_name, ip=host.ip,
+                               port=port.number, protocol=port.protocol)
+                rows.append(rowdata)
+
+        writer.writerows(rows)
@@ -7,6 +7,11 @@
 """This file contains data structures"""
 
 import re
+import sys
+
+# Port strings, such as "443/tcp" or "general/icmp"
+_RE_PORT_NR = re.compile(r"([\d]+)(/)([\w]+)")
+_RE_PORT_GENERAL = re.compile(r"(general)(/)([\w]+)")
 
 # Port object modifed to include result data field
 class Port(object):
@@ -84,15 +89,15 @@ class Port(object):
         if not isinstance(result, str):
             raise TypeError("Expected basestring, got '{}' instead".format(type(result)))
 
-        regex_nr = re.search("([\d]+)(/)([\w]+)", info)
-        regex_general = re.search("(general)(/)([\w]+)", info)
+        regex_nr = _RE_PORT_NR.search(info)
+        regex_general = _RE_PORT_GENERAL.search(info)
 
         if regex_nr and len(regex_nr.groups()) == 3:
             number = int(regex_nr.group(1))
-            protocol = regex_nr.group(3)
+            protocol = sys.intern(regex_nr.group(3))
         elif regex_general and len(regex_general.groups()) == 3:
             number = 0
-            protocol = regex_general.group(3)
+            protocol = sys.intern(regex_general.group(3))
         else:
             raise ValueError("Can't parse port input string")
 
@@ -156,7 +161,7 @@ class Vulnerability(object):
         :param cvss: CVSS number value
         :type cvss: float
 
-        :param level: Threat level according to CVSS: None, Low, Medium, High, Critical
+        :param level: Threat level according to CVSS: None, Low, Medium, High, Critical (stored lowercase)
         :type level: str
 
         :param tags: vulnerability tags
@@ -216,7 +221,7 @@ class Vulnerability(object):
         self.name = name
         self.cves = cves
         self.cvss = float(cvss)
-        self.level = level
+        self.level = sys.intern(level.lower())
         self.description = tags.get('summary', '')
         self.detect = tags.get('vuldetect', '')
         self.insight = tags.get('insight', '')
@@ -3,9 +3,14 @@
 #
 # Project name: OpenVAS Reporting: A tool to convert OpenVAS XML reports into Excel files.
 # Project URL: https://github.com/TheGroundZero/openvasreporting
+import os
 import re
+import math
 import sys
 import logging
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 from .config import Config
 from .parsed_data import Host, Port, Vulnerability
@@ -17,10 +22,99 @@ logging.basicConfig(stream=sys.stderr, level=logging.ERROR,
 
 __all__ = ["openvas_parser"]
 
-try:
-    from xml.etree import cElementTree as Et
-except ImportError:
-    from xml.etree import ElementTree as Et
+from lxml import etree
+
+# Tag text normalization: a single scan only matches what has to change, newline runs and whitespace
+# other than a lone space. Newline runs are then collapsed as "(\r\n)+" -> "\r\n" followed by "\n+" -> "\n".
+_RE_TAGNORM = re.compile(r"[\r\n]{2,}|[^\S\r\n]{2,}|[^\S \r\n]")
+_RE_CRLF = re.compile(r"(\r\n)+")
+_RE_NL = re.compile(r"\n+")
+
+# Levels sorted by ascending CVSS threshold: a score's level is the one with the highest threshold it reaches
+_LEVEL_TABLE = sorted((Config.thresholds()[level], level) for level in Config.levels().values())
+_LEVEL_THRESHOLDS = [threshold for threshold, _ in _LEVEL_TABLE]
+_LEVEL_NAMES = [level for _, level in _LEVEL_TABLE]
+
+
+def _tagnorm_sub(match):
+    """
+    Replacement for _RE_TAGNORM matches
+
+    :param match: newline run or whitespace to normalize
+    :type match: re.Match
+
+    :return: replacement text
+    :rtype: str
+    """
+    text = match.group(0)
+    if text[0] in "\r\n":
+        return _RE_NL.sub("\n", _RE_CRLF.sub("\r\n", text))
+    # Remove useless whitespace but not newlines
+    return " "
+
+# Fields read from each <result> element, compiled once. Plain str results (no smart strings) so parsed
+# vulnerabilities do not keep a reference to the XML tree, and can be sent across processes.
+_XP_OID = etree.XPath("./nvt/@oid", smart_strings=False)
+_XP_NAME = etree.XPath("./nvt/name/text()", smart_strings=False)
+_XP_SEVERITY = etree.XPath("./severity/text()", smart_strings=False)
+_XP_HOST = etree.XPath("./host/text()", smart_strings=False)
+_XP_HOSTNAME = etree.XPath("./host/hostname/text()", smart_strings=False)
+_XP_PORT = etree.XPath("./port/text()", smart_strings=False)
+_XP_TAGS = etree.XPath("./nvt/tags/text()", smart_strings=False)
+_XP_THREAT = etree.XPath("./threat/text()", smart_strings=False)
+_XP_FAMILY = etree.XPath("./nvt/family/text()", smart_strings=False)
+_XP_CVE = etree.XPath("./nvt/cve/text()", smart_strings=False)
+_XP_XREF = etree.XPath("./nvt/xref/text()", smart_strings=False)
+_XP_DESCRIPTION = etree.XPath("./description/text()", smart_strings=False)
+
+
+def _find_text(xpath, element):
+    """
+    Evaluate a compiled XPath on element and return the first match
+
+    :param xpath: compiled XPath
+    :type xpath: etree.XPath
+
+    :param element: element to evaluate the XPath on
+    :type element: etree._Element
+
+    :return: first matching text, None if there is no match
+    :rtype: str
+    """
+    found = xpath(element)
+    return found[0] if found else None
+
+
+def _iter_results(f_file):
+    """
+    Stream the <result> elements of an OpenVAS XML report, dropping each one once it has been processed,
+    so memory does not grow with the number of results
+
+    :param f_file: path to XML file
+    :type f_file: str
+
+    :return: generator of <result> elements
+
+    :raises: IOError
+    """
+    with open(f_file, "rb") as f:
+        # The report format is checked on the start of the file, peeked from the read buffer so the same
+        # file object is then handed to the parser
+        first_line = f.peek(256)[:256].split(b"\n", 1)[0]
+        if not first_line.startswith(b"<report") or \
+                not all(True for x in (b"extension", b"format_id", b"content_type") if x in first_line):
+            raise IOError("Invalid report format")
+
+        for _, result in etree.iterparse(f, tag="result", huge_tree=True):
+            parent = result.getparent()
+            # Detection details nest their own <result> elements, only report results are vulnerabilities
+            if parent is None or parent.tag != "results":
+                continue
+            yield result
+            result.clear()
+            # Cleared results are still attached to <results>, delete them too
+            while result.getprevious() is not None:
+                del parent[0]
 
 
 def openvas_parser(input_files, min_level=Config.levels()["n"]):
@@ -43,184 +137,205 @@ def openvas_parser(input_files, min_level=Config.levels()["n"]):
         for file in input_files:
             if not isinstance(file, str):
                 raise TypeError("Expected basestring, got '{}' instead".format(type(file)))
-            with open(file, "r", newline=None) as f:
-                first_line = f.readline()
-                if not first_line.startswith("<report") or \
-                        not all(True for x in ("extension", "format_id", "content_type") if x in first_line):
-                    raise IOError("Invalid report format")
 
     if not isinstance(min_level, str):
         raise TypeError("Expected basestring, got '{}' instead".format(type(min_level)))
 
+    # Each file yields its own vulnerabilities, so files are parsed in separate processes
+    if len(input_files) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(input_files), os.cpu_count() or 1)) as executor:
+            parsed_files = list(executor.map(_parse_file, input_files, repeat(min_level)))
+    else:
+        parsed_files = [_parse_file(f_file, min_level) for f_file in input_files]
+
+    # Merge per-file results, keeping the first occurrence of each vulnerability
     vulnerabilities = {}
+    for parsed in parsed_files:
+        for vuln_id, vuln in parsed.items():
+            vuln_store = vulnerabilities.get(vuln_id)
+            if vuln_store is None:
+                vulnerabilities[vuln_id] = vuln
+                continue
 
-    for f_file in input_files:
-        root = Et.parse(f_file).getroot()
+            for host, port in vuln.hosts:
+                vuln_store.add_vuln_host(host, port)
 
-        logging.debug("================================================================================")
-#        logging.debug("= {}".format(root.find("./task/name").text))  # DEBUG
-        logging.debug("================================================================================")
+    return list(vulnerabilities.values())
 
-        for vuln in root.findall(".//results/result"):
 
-            nvt_tmp = vuln.find("./nvt")
+def _parse_file(f_file, min_level):
+    """
+    Parse a single OpenVAS XML report
 
-            # --------------------
-            #
-            # VULN_NAME
-            vuln_name = nvt_tmp.find("./name").text
+    :param f_file: path to XML file
+    :type f_file: str
 
-            logging.debug("--------------------------------------------------------------------------------")
-            logging.debug("- {}".format(vuln_name))  # DEBUG
-            logging.debug("--------------------------------------------------------------------------------")
+    :param min_level: Minimal level (none, low, medium, high, critical) for displaying vulnerabilities
+    :type min_level: str
 
-            # --------------------
-            #
-            # VULN_ID
-            vuln_id = nvt_tmp.get("oid")
-            if not vuln_id or vuln_id == "0":
-                logging.debug("  ==> SKIP")  # DEBUG
-                continue
-            logging.debug("* vuln_id:\t{}".format(vuln_id))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_CVSS
-            vuln_cvss = vuln.find("./severity").text
-            if vuln_cvss is None:
-                vuln_cvss = 0.0
-            vuln_cvss = float(vuln_cvss)
-            logging.debug("* vuln_cvss:\t{}".format(vuln_cvss))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_LEVEL
-            vuln_level = "none"
-            for level in Config.levels().values():
-                if vuln_cvss >= Config.thresholds()[level]:
-                    vuln_level = level
-                    logging.debug("* vuln_level:\t{}".format(vuln_level))  # DEBUG
-                    break
-
-            logging.debug("* min_level:\t{}".format(min_level))  # DEBUG
-            if vuln_level not in Config.min_levels()[min_level]:
-                logging.debug("   => SKIP")  # DEBUG
-                continue
+    :return: Vulnerabilities found in the report, by vulnerability id
+    :rtype: dict(str, Vulnerability)
+
+    :raises: IOError
+    """
+    vulnerabilities = {}
 
-            # --------------------
-            #
-            # VULN_HOST
-            vuln_host = vuln.find("./host").text
-            vuln_hostname = '-'
-            if vuln.find("./host/hostname").text:
-                vuln_hostname = vuln.find("./host/hostname").text
-            elif 'vuln_hostname' in globals():
-                del vuln_hostname
-            vuln_port = vuln.find("./port").text
-            if vuln_hostname:
-                logging.debug("* vuln_host:\t{} hostname:\t{} port:\t{}".format(vuln_host, vuln_hostname, vuln_port))  # DEBUG
+    logging.debug("================================================================================")
+    logging.debug("= {}".format(f_file))  # DEBUG
+    logging.debug("================================================================================")
+
+    # Levels to keep do not change between results
+    min_level_set = set(Config.min_levels()[min_level])
+    no_threat = Config.levels()["n"]
+
+    for vuln in _iter_results(f_file):
+
+        # --------------------
+        #
+        # VULN_NAME
+        vuln_name = _find_text(_XP_NAME, vuln)
+
+        logging.debug("--------------------------------------------------------------------------------")
+        logging.debug("- {}".format(vuln_name))  # DEBUG
+        logging.debug("--------------------------------------------------------------------------------")
+
+        # --------------------
+        #
+        # VULN_ID
+        vuln_id = _find_text(_XP_OID, vuln)
+        if not vuln_id or vuln_id == "0":
+            logging.debug("  ==> SKIP")  # DEBUG
+            continue
+        logging.debug("* vuln_id:\t{}".format(vuln_id))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_CVSS
+        vuln_cvss = _find_text(_XP_SEVERITY, vuln)
+        if vuln_cvss is None:
+            vuln_cvss = 0.0
+        vuln_cvss = float(vuln_cvss)
+        logging.debug("* vuln_cvss:\t{}".format(vuln_cvss))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_LEVEL
+        level_idx = 0 if math.isnan(vuln_cvss) else bisect_right(_LEVEL_THRESHOLDS, vuln_cvss)
+        vuln_level = _LEVEL_NAMES[level_idx - 1] if level_idx else "none"
+        logging.debug("* vuln_level:\t{}".format(vuln_level))  # DEBUG
+
+        logging.debug("* min_level:\t{}".format(min_level))  # DEBUG
+        if vuln_level not in min_level_set:
+            logging.debug("   => SKIP")  # DEBUG
+            continue
+
+        # --------------------
+        #
+        # VULN_HOST
+        vuln_host = _find_text(_XP_HOST, vuln)
+        vuln_hostname = _find_text(_XP_HOSTNAME, vuln) or '-'
+        vuln_port = _find_text(_XP_PORT, vuln)
+        logging.debug("* vuln_host:\t{} hostname:\t{} port:\t{}".format(vuln_host, vuln_hostname, vuln_port))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_TAGS
+        # Replace double newlines by a single newline, and useless whitespace by a single space
+        vuln_tags_text = _RE_TAGNORM.sub(_tagnorm_sub, _find_text(_XP_TAGS, vuln))
+        vuln_tags = {}
+        for tag in vuln_tags_text.split('|'):
+            # Malformed tags without "=" are skipped instead of failing the whole report
+            tag_name, sep, tag_value = tag.partition('=')
+            if sep:
+                vuln_tags[tag_name] = tag_value
+        logging.debug("* vuln_tags:\t{}".format(vuln_tags))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_THREAT
+        vuln_threat = _find_text(_XP_THREAT, vuln)
+        if vuln_threat is None:
+            vuln_threat = no_threat
+        else:
+            vuln_threat = sys.intern(vuln_threat.lower())
+
+        logging.debug("* vuln_threat:\t{}".format(vuln_threat))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_FAMILY
+        vuln_family = _find_text(_XP_FAMILY, vuln)
+        # Families repeat across results, share a single string per family
+        if vuln_family is not None:
+            vuln_family = sys.intern(vuln_family)
+
+        logging.debug("* vuln_family:\t{}".format(vuln_family))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_CVES
+        vuln_cves = _find_text(_XP_CVE, vuln)
+        if vuln_cves:
+            if vuln_cves.lower() == "nocve":
+                vuln_cves = []
             else:
-                logging.debug("* vuln_host:\t{} port:\t{}".format(vuln_host, vuln_port))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_TAGS
-            # Replace double newlines by a single newline
-            vuln_tags_text = re.sub(r"(\r\n)+", "\r\n", nvt_tmp.find("./tags").text)
-            vuln_tags_text = re.sub(r"\n+", "\n", vuln_tags_text)
-            # Remove useless whitespace but not newlines
-            vuln_tags_text = re.sub(r"[^\S\r\n]+", " ", vuln_tags_text)
-            vuln_tags_temp = vuln_tags_text.split('|')
-            vuln_tags = dict(tag.split('=', 1) for tag in vuln_tags_temp)
-            logging.debug("* vuln_tags:\t{}".format(vuln_tags))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_THREAT
-            vuln_threat = vuln.find("./threat").text
-            if vuln_threat is None:
-                vuln_threat = Config.levels()["n"]
+                vuln_cves = [vuln_cves.lower()]
+
+        logging.debug("* vuln_cves:\t{}".format(vuln_cves))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_REFERENCES
+        vuln_references = _find_text(_XP_XREF, vuln)
+        if vuln_references:
+            if vuln_references.lower() == "noxref":
+                vuln_references = []
             else:
-                vuln_threat = vuln_threat.lower()
-
-            logging.debug("* vuln_threat:\t{}".format(vuln_threat))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_FAMILY
-            vuln_family = nvt_tmp.find("./family").text
-
-            logging.debug("* vuln_family:\t{}".format(vuln_family))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_CVES
-            vuln_cves = nvt_tmp.find("./cve").text
-            if vuln_cves:
-                if vuln_cves.lower() == "nocve":
-                    vuln_cves = []
-                else:
-                    vuln_cves = [vuln_cves.lower()]
-
-            logging.debug("* vuln_cves:\t{}".format(vuln_cves))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_REFERENCES
-            vuln_references = nvt_tmp.find("./xref").text
-            if vuln_references:
-                if vuln_references.lower() == "noxref":
-                    vuln_references = []
-                else:
-                    # tmp1 = vuln_references.strip().lower()
-                    # tmp1_init = tmp1.find("url:")
-                    #tmp2 = tmp1[tmp1_init + 4:].split(",")
-                    vuln_references = vuln_references.lower().replace("url:", "\n")
-
-            logging.debug("* vuln_references:\t{}".format(vuln_references))  # DEBUG
-
-            # --------------------
-            #
-            # VULN_DESCRIPTION
-            test=vuln.find("./description")
-            if test is not None:
-                vuln_result = vuln.find("./description").text
-            
-            if test is None or vuln_result is None:
-                vuln_result = []
-
-            if type(vuln_result) == list:
-                vuln_result = "\n".join(vuln_result)
-
-            # Replace double newlines by a single newline
-            vuln_result = vuln_result.replace("(\r\n)+", "\n")
-
-            logging.debug("* vuln_result:\t{}".format(vuln_result))  # DEBUG
-
-            # --------------------
-            #
-            # STORE VULN_HOSTS PER VULN
-            host = Host(vuln_host, vuln_hostname)
-            try:
+                # tmp1 = vuln_references.strip().lower()
+                # tmp1_init = tmp1.find("url:")
+                #tmp2 = tmp1[tmp1_init + 4:].split(",")
+                vuln_references = vuln_references.lower().replace("url:", "\n")
+
+        logging.debug("* vuln_references:\t{}".format(vuln_references))  # DEBUG
+
+        # --------------------
+        #
+        # VULN_DESCRIPTION
+        vuln_result = _find_text(_XP_DESCRIPTION, vuln)
+        if vuln_result is None:
+            vuln_result = []
+
+        if type(vuln_result) == list:
+            vuln_result = "\n".join(vuln_result)
+
+        # Replace double newlines by a single newline
+        vuln_result = vuln_result.replace("(\r\n)+", "\n")
+
+        logging.debug("* vuln_result:\t{}".format(vuln_result))  # DEBUG
+
+        # --------------------
+        #
+        # STORE VULN_HOSTS PER VULN
+        host = Host(vuln_host, vuln_hostname)
+        try:
 	    # added results to port function as will ne unique per port on each host.
-                port = Port.string2port(vuln_port, vuln_result)
-            except ValueError:
-                port = None
-
-            try:
-                vuln_store = vulnerabilities[vuln_id]
-            except KeyError:
-                vuln_store = Vulnerability(vuln_id,
-                                           name=vuln_name,
-                                           threat=vuln_threat,
-                                           tags=vuln_tags,
-                                           cvss=vuln_cvss,
-                                           cves=vuln_cves,
-                                           references=vuln_references,
-                                           family=vuln_family,
-                                           level=vuln_level)
-
-            vuln_store.add_vuln_host(host, port)
+            port = Port.string2port(vuln_port, vuln_result)
+        except ValueError:
+            port = None
+
+        vuln_store = vulnerabilities.get(vuln_id)
+        if vuln_store is None:
+            vuln_store = Vulnerability(vuln_id,
+                                       name=vuln_name,
+                                       threat=vuln_threat,
+                                       tags=vuln_tags,
+                                       cvss=vuln_cvss,
+                                       cves=vuln_cves,
+                                       references=vuln_references,
+                                       family=vuln_family,
+                                       level=vuln_level)
             vulnerabilities[vuln_id] = vuln_store
 
-    return list(vulnerabilities.values())
+        vuln_store.add_vuln_host(host, port)
+
+    return vulnerabilities
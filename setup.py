@@ -16,7 +16,7 @@ setup(
     author_email='2406013+TheGroundZero@users.noreply.github.com',
     url='https://github.com/TheGroundZero/openvasreporting',
     packages=['openvasreporting'],
-    install_requires=['xlsxwriter>=1.0.0', 'python-docx>=0.8.7', 'matplotlib>=2.2.2'],
+    install_requires=['xlsxwriter>=1.0.0', 'python-docx>=0.8.7', 'matplotlib>=2.2.2', 'lxml>=3.1.0'],
     python_requires='~=3.7',
     entry_points={
         'console_scripts': ['openvasreporting = openvasreporting:main']